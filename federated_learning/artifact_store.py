@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+ARTIFACTS_DIR = './artifacts'
+ARTIFACTS_PORT = 8888
+MANIFEST_NAME = 'latest.json'
+# `.tflite` conversion isn't byte-for-byte reproducible, the checkpoint (weights + names) is,
+# so its hash identifies the version of both files
+VERSION_KIND = 'ckpt'
+
+_MODEL_NAME = re.compile(r'^[A-Za-z0-9_]+$')
+_ARTIFACT_NAME = re.compile(r'^(?P<version>[0-9a-f]{64})\.(?P<kind>tflite|ckpt)$')
+_LATEST_NAME = re.compile(r'^latest\.(?P<kind>tflite|ckpt)$')
+_RANGE = re.compile(r'^bytes=(?P<start>\d+)-(?P<end>\d*)$|^bytes=-(?P<suffix>\d+)$')
+
+
+class ArtifactStore:
+    """Directory of immutable, content-addressed model files, one subdirectory per model.
+
+    Every published round writes `<version>.tflite` and `<version>.ckpt`, where version is the sha256 of
+    the checkpoint, and then atomically replaces `latest.json` pointing at them. Files are never
+    overwritten, so republishing the same weights keeps the existing pair.
+    """
+    def __init__(self, root: str = ARTIFACTS_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def model_dir(self, name: str) -> str:
+        if not _MODEL_NAME.match(name):
+            raise ValueError(f'invalid model name: {name}')
+        return os.path.join(self.root, name)
+
+    def publish(self, name: str, server_round: int, files: dict[str, bytes]) -> dict:
+        """Store `files` ({'tflite': ..., 'ckpt': ...}) and make them the latest version of model `name`."""
+        model_dir = self.model_dir(name)
+        os.makedirs(model_dir, exist_ok=True)
+
+        version = hashlib.sha256(files[VERSION_KIND]).hexdigest()
+        manifest = {"round": server_round, "version": version}
+        for kind, content in files.items():
+            path = os.path.join(model_dir, f'{version}.{kind}')
+            if not os.path.exists(path):
+                _write_atomic(path, content)
+            manifest[kind] = {"file": f'{version}.{kind}', "size": os.path.getsize(path)}
+
+        with self.lock:
+            _write_atomic(os.path.join(model_dir, MANIFEST_NAME), json.dumps(manifest).encode())
+        return manifest
+
+    def latest(self, name: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.model_dir(name), MANIFEST_NAME), 'rb') as manifest_file:
+                return json.loads(manifest_file.read())
+        except FileNotFoundError:
+            return None
+
+
+def _write_atomic(path: str, content: bytes):
+    tmp_path = f'{path}.tmp{threading.get_ident()}'
+    with open(tmp_path, 'wb') as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, path)
+
+
+class ArtifactRequestHandler(BaseHTTPRequestHandler):
+    """Serves an ArtifactStore:
+
+    - `/<model>/latest.json` - manifest of the latest round
+    - `/<model>/latest.tflite`, `/<model>/latest.ckpt` - latest files, revalidated with If-None-Match
+    - `/<model>/<version>.tflite`, `/<model>/<version>.ckpt` - immutable files, cacheable forever
+
+    ETag of a file is its version, so a device that already has the latest model gets 304 without body.
+    Single byte ranges are supported to resume interrupted downloads.
+    """
+    store: ArtifactStore = None
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def handle_request(self, send_body: bool):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) != 2 or not _MODEL_NAME.match(parts[0]):
+            return self.send_error(HTTPStatus.NOT_FOUND)
+        name, file_name = parts
+
+        if file_name == MANIFEST_NAME:
+            manifest = self.store.latest(name)
+            if manifest is None:
+                return self.send_error(HTTPStatus.NOT_FOUND)
+            content = json.dumps(manifest).encode()
+            etag = hashlib.sha256(content).hexdigest()
+            return self.send_content(content, etag, 'application/json', 'no-cache', send_body)
+
+        match = _ARTIFACT_NAME.match(file_name)
+        if match:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            match = _LATEST_NAME.match(file_name)
+            manifest = self.store.latest(name) if match else None
+            if manifest is None or match['kind'] not in manifest:
+                return self.send_error(HTTPStatus.NOT_FOUND)
+            file_name = manifest[match['kind']]['file']
+            match = _ARTIFACT_NAME.match(file_name)
+            cache_control = 'no-cache'
+
+        try:
+            with open(os.path.join(self.store.model_dir(name), file_name), 'rb') as artifact_file:
+                content = artifact_file.read()
+        except FileNotFoundError:
+            return self.send_error(HTTPStatus.NOT_FOUND)
+        self.send_content(content, match['version'], 'application/octet-stream', cache_control, send_body)
+
+    def send_content(self, content: bytes, etag: str, content_type: str, cache_control: str, send_body: bool):
+        etag = f'"{etag}"'
+        if _etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            return
+
+        size = len(content)
+        status = HTTPStatus.OK
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        # multiple or malformed ranges are ignored and the whole file is sent
+        if range_header is not None and _RANGE.match(range_header.strip()) and if_range in (None, etag):
+            byte_range = _parse_range(range_header, size)
+            if byte_range is None:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(content[start:end + 1])
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # weak comparison, as required for If-None-Match
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in tags
+
+def _parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """Parse a single `bytes=start-end` or `bytes=-suffix` range, None if it can't be satisfied."""
+    match = _RANGE.match(range_header.strip())
+    if match['suffix'] is not None:
+        suffix = int(match['suffix'])
+        if suffix == 0 or size == 0:
+            return None
+        return max(size - suffix, 0), size - 1
+    start = int(match['start'])
+    end = min(int(match['end']), size - 1) if match['end'] else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+
+def serve_artifacts(store: ArtifactStore, port: int = ARTIFACTS_PORT) -> ThreadingHTTPServer:
+    """Start the artifact HTTP server in a background thread."""
+    handler = type('StoreRequestHandler', (ArtifactRequestHandler,), {'store': store})
+    server = ThreadingHTTPServer(('0.0.0.0', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    # serve an existing store, e.g. after federate_server.py finished training
+    store = ArtifactStore(sys.argv[1] if len(sys.argv) > 1 else ARTIFACTS_DIR)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else ARTIFACTS_PORT
+    server = serve_artifacts(store, port)
+    print(f'serving artifacts from {store.root} on port {server.server_port}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
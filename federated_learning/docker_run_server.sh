@@ -1,3 +1,4 @@
 #!/bin/bash
 
-sudo docker run -it -p 8885:8885 -p 8886:8886 -p 8887:8887 flok3n/federated-server:1.0.1
+# args: <min_clients> <rounds> <artifacts_dir>, artifacts are kept in ./artifacts on the host and served on port 8888
+sudo docker run -it -p 8885:8885 -p 8886:8886 -p 8887:8887 -p 8888:8888 -v "$(pwd)/artifacts:/app/artifacts" flok3n/federated-server:1.0.1 1 5 /app/artifacts
@@ -0,0 +1,137 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import flwr as fl
+from flwr.common import (Code, EvaluateIns, EvaluateRes, FitIns, FitRes,
+                         GetParametersIns, GetParametersRes, Status)
+from flwr.server import (History, Server, ServerConfig, SimpleClientManager,
+                         start_server)
+from flwr.server.strategy import FedAvgAndroid
+
+from federate_server import PORTS
+
+
+class AggregatorServer(Server):
+    """Flower server whose rounds are driven by an upstream server instead of a fixed round count.
+
+    Phones connect to it exactly as they would to `federate_server.py`. Each round requested by the
+    upstream server is run against the connected phones and their updates are pre-averaged
+    (weighted by example counts) by the local FedAvgAndroid strategy.
+    """
+    def __init__(self, min_clients: int):
+        self.fit_config = {}
+        self.evaluate_config = {}
+        strategy = FedAvgAndroid(
+            fraction_fit=1.0,
+            fraction_evaluate=1.0,
+            min_fit_clients=min_clients,
+            min_evaluate_clients=min_clients,
+            min_available_clients=min_clients,
+            evaluate_fn=None,
+            # phones get the same config the upstream server sent to this aggregator
+            on_fit_config_fn=lambda server_round: self.fit_config,
+            on_evaluate_config_fn=lambda server_round: self.evaluate_config,
+        )
+        super().__init__(client_manager=SimpleClientManager(), strategy=strategy)
+        self.finished = threading.Event()
+
+    def fit(self, num_rounds: int, timeout: Optional[float]) -> History:
+        # rounds are run from AggregatorClient, start_server only has to keep grpc server alive.
+        # Return type matches the pinned flwr version (requirements.server.txt), newer ones expect (History, elapsed)
+        self.finished.wait()
+        return History()
+
+
+class AggregatorClient(fl.client.Client):
+    """Upstream-facing side of an aggregator, seen by the top-level server as a single weighted client.
+
+    Parameters are passed through in the raw float32 encoding used by FedAvgAndroid, so nothing is
+    converted on the way between phones and the top-level server.
+    """
+    def __init__(self, server: AggregatorServer, timeout: Optional[float] = None):
+        self.server = server
+        self.timeout = timeout
+        self.server_round = 0
+
+    def get_parameters(self, ins: GetParametersIns) -> GetParametersRes:
+        # FedAvgAndroid has no initial parameters by default, then they come from a random phone
+        client_manager = self.server.client_manager()
+        parameters = self.server.strategy.initialize_parameters(client_manager=client_manager)
+        if parameters is None:
+            phone = client_manager.sample(1)[0]
+            parameters = phone.get_parameters(ins=GetParametersIns(config={}), timeout=self.timeout).parameters
+        return GetParametersRes(status=Status(code=Code.OK, message=""), parameters=parameters)
+
+    def fit(self, ins: FitIns) -> FitRes:
+        self.server_round += 1
+        self.server.parameters = ins.parameters
+        self.server.fit_config = ins.config
+
+        res = self.server.fit_round(server_round=self.server_round, timeout=self.timeout)
+        if res is None or res[0] is None:
+            # reported as a failure to the upstream server, raising would end start_client and drop all phones
+            message = f'round {self.server_round}: no fit results from connected clients'
+            print(message)
+            return FitRes(status=Status(code=Code.FIT_NOT_IMPLEMENTED, message=message), parameters=ins.parameters,
+                          num_examples=0, metrics={})
+        parameters, metrics, (results, _) = res
+        # weighted average of per-aggregator averages equals flat FedAvg only if weight = total examples
+        num_examples = sum(fit_res.num_examples for _, fit_res in results)
+        return FitRes(status=Status(code=Code.OK, message=""), parameters=parameters,
+                      num_examples=num_examples, metrics=metrics)
+
+    def evaluate(self, ins: EvaluateIns) -> EvaluateRes:
+        self.server.parameters = ins.parameters
+        self.server.evaluate_config = ins.config
+
+        res = self.server.evaluate_round(server_round=self.server_round, timeout=self.timeout)
+        if res is None or res[0] is None:
+            message = f'round {self.server_round}: no evaluate results from connected clients'
+            print(message)
+            return EvaluateRes(status=Status(code=Code.EVALUATE_NOT_IMPLEMENTED, message=message), loss=0.,
+                               num_examples=0, metrics={})
+        loss, metrics, (results, _) = res
+        num_examples = sum(evaluate_res.num_examples for _, evaluate_res in results)
+        return EvaluateRes(status=Status(code=Code.OK, message=""), loss=loss,
+                           num_examples=num_examples, metrics=metrics)
+
+
+def run_aggregator(port, upstream_address, min_clients, name):
+    server = AggregatorServer(min_clients)
+    server_thread = threading.Thread(target=start_server, kwargs={
+        "server_address": f"0.0.0.0:{port}",
+        "server": server,
+        "config": ServerConfig(num_rounds=1), # ignored, upstream server decides when training ends
+    })
+
+    try:
+        print(f'{name}: running aggregator on port {port}, upstream {upstream_address}')
+        server_thread.start()
+        fl.client.start_client(server_address=upstream_address, client=AggregatorClient(server))
+        print(f'{name}: upstream server finished')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # disconnects phones and stops grpc server
+        server.finished.set()
+        server_thread.join()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('usage: federate_aggregator.py <upstream_host> [min_clients] [port_offset]')
+        sys.exit(1)
+    upstream_host = sys.argv[1]
+    min_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    port_offset = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print(f'upstream_host={upstream_host} min_clients={min_clients} port_offset={port_offset}')
+
+    with ThreadPoolExecutor(len(PORTS)) as executor:
+        jobs = [
+            executor.submit(run_aggregator, port + port_offset, f'{upstream_host}:{port}', min_clients, name)
+            for name, port in PORTS.items()
+        ]
+        executor.shutdown(wait=True)
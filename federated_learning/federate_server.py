@@ -1,9 +1,19 @@
 import sys
+import threading
+import traceback
 from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from flwr.server import ServerConfig, start_server
 from flwr.server.strategy import FedAvgAndroid
 
+from artifact_store import ArtifactStore, serve_artifacts
+
+PORTS = {
+    "local_time": 8885,
+    "cloud_computation_time": 8886,
+    "cloud_transmission_time": 8887
+}
 
 def fit_config(server_round: int):
     """Return training configuration dict for each round.
@@ -14,8 +24,65 @@ def fit_config(server_round: int):
     }
     return config
 
-def run_server(port, min_clients, training_rounds, name):
-    strategy = FedAvgAndroid(
+class ModelPublisher:
+    """Exports aggregated weights to `.tflite` + checkpoint and puts them in the artifact store.
+
+    Exports run one at a time in a background thread, so they don't delay training rounds. Only the
+    newest round waiting for export is kept per model, rounds superseded before their export starts are
+    skipped, so the store never lags more than one export behind training.
+    """
+    def __init__(self, store: ArtifactStore):
+        self.store = store
+        self.executor = ThreadPoolExecutor(1)
+        self.lock = threading.Lock()
+        self.pending = {} # name -> (server_round, weights) not yet picked up by the executor
+
+    def submit(self, name, server_round, weights):
+        with self.lock:
+            scheduled = name in self.pending
+            if scheduled:
+                print(f'{name}: skipping export of round {self.pending[name][0]}, superseded by round {server_round}')
+            self.pending[name] = (server_round, weights)
+        if not scheduled:
+            self.executor.submit(self.publish_pending, name)
+
+    def publish_pending(self, name):
+        with self.lock:
+            server_round, weights = self.pending.pop(name)
+        self.publish(name, server_round, weights)
+
+    def publish(self, name, server_round, weights):
+        try:
+            # tensorflow is only needed when artifacts are published
+            from models import export_trained_model
+            manifest = self.store.publish(name, server_round, export_trained_model(name, weights))
+            print(f'{name}: published round {server_round} model {manifest["tflite"]["file"]}')
+        except Exception:
+            traceback.print_exc()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class PublishingFedAvgAndroid(FedAvgAndroid):
+    """FedAvgAndroid that publishes the global model after every round."""
+    def __init__(self, name: str, publisher: ModelPublisher, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.publisher = publisher
+
+    def aggregate_fit(self, server_round, results, failures):
+        parameters, metrics = super().aggregate_fit(server_round, results, failures)
+        if parameters is not None:
+            self.publisher.submit(self.name, server_round, self.parameters_to_ndarrays(parameters))
+        return parameters, metrics
+
+
+def run_server(port, min_clients, training_rounds, name, publisher: Optional[ModelPublisher] = None):
+    strategy_cls = FedAvgAndroid if publisher is None else PublishingFedAvgAndroid
+    strategy_args = {} if publisher is None else {"name": name, "publisher": publisher}
+    strategy = strategy_cls(
+        **strategy_args,
         fraction_fit=1.0, 
         fraction_evaluate=1.0,
         min_fit_clients=min_clients, # start training after this number of devices connect
@@ -39,21 +106,35 @@ def run_server(port, min_clients, training_rounds, name):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 1:
+    # --keep-serving: don't exit after training, keep serving the final models to new devices
+    keep_serving = '--keep-serving' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--keep-serving']
+    if len(args) == 0:
         min_clients = 1
         training_rounds = 5
     else:
-        min_clients = int(sys.argv[1])
-        training_rounds = int(sys.argv[2])
+        min_clients = int(args[0])
+        training_rounds = int(args[1])
+    artifacts_dir = args[2] if len(args) > 2 else None
 
-    print(f'min_clients={min_clients} training_rounds={training_rounds}')
+    print(f'min_clients={min_clients} training_rounds={training_rounds} artifacts_dir={artifacts_dir} keep_serving={keep_serving}')
 
-    ports = {
-        "local_time": 8885,
-        "cloud_computation_time": 8886,
-        "cloud_transmission_time": 8887
-    }
-    with ThreadPoolExecutor(len(ports)) as executor:
-        jobs = [executor.submit(run_server, port, min_clients, training_rounds, name) for name, port in ports.items()]
+    publisher = None
+    if artifacts_dir is not None:
+        store = ArtifactStore(artifacts_dir)
+        publisher = ModelPublisher(store)
+        http_server = serve_artifacts(store)
+        print(f'serving artifacts from {artifacts_dir} on port {http_server.server_port}')
+
+    with ThreadPoolExecutor(len(PORTS)) as executor:
+        jobs = [executor.submit(run_server, port, min_clients, training_rounds, name, publisher) for name, port in PORTS.items()]
         executor.shutdown(wait=True)
-    
\ No newline at end of file
+
+    if publisher is not None:
+        publisher.shutdown()
+        if keep_serving:
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        http_server.shutdown()
@@ -1,4 +1,5 @@
 import os
+import time
 
 import numpy as np
 import tensorflow as tf
@@ -110,6 +111,46 @@ def pretrain() -> FmnistModel:
     return model 
 
 
+def pretrain_fast(num_epochs=20, batch_size=100, shuffle_buffer=10_000, steps_per_call=50, jit_compile=False) -> FmnistModel:
+    """Same training as `pretrain`, but with cached/prefetched input and `steps_per_call` train steps
+    per compiled function call, loss is accumulated on device and read once per epoch.
+    """
+    train_ds = tf.data.Dataset.from_tensor_slices((train_images, train_labels)).cache()
+    train_ds = train_ds.shuffle(shuffle_buffer, reshuffle_each_iteration=True).repeat()
+    train_ds = train_ds.batch(batch_size, drop_remainder=True)
+    train_ds = train_ds.map(lambda x, y: (tf.cast(x, tf.float32), tf.cast(y, tf.float32)),
+                            num_parallel_calls=tf.data.AUTOTUNE)
+    train_ds = train_ds.prefetch(tf.data.AUTOTUNE)
+    steps_per_epoch = train_images.shape[0] // batch_size
+
+    model = FmnistModel()
+    loss_sum = tf.Variable(0., dtype=tf.float32, trainable=False)
+
+    @tf.function(jit_compile=jit_compile)
+    def train_step(x, y):
+        return model.train_epoch(x, y)['loss']
+
+    @tf.function
+    def train_steps(iterator, steps):
+        for _ in tf.range(steps):
+            x, y = next(iterator)
+            loss_sum.assign_add(train_step(x, y))
+
+    iterator = iter(train_ds)
+
+    for i in range(num_epochs):
+        start = time.perf_counter()
+        loss_sum.assign(0.)
+        for step in range(0, steps_per_epoch, steps_per_call):
+            train_steps(iterator, tf.constant(min(steps_per_call, steps_per_epoch - step)))
+        loss = loss_sum.numpy() / steps_per_epoch
+        elapsed = time.perf_counter() - start
+        print(f'epoch {i + 1}: loss={loss} ({steps_per_epoch * batch_size / elapsed:.0f} samples/s)')
+
+    model.save(tf.constant('./model'))
+    return model
+
+
 def test(predictor):
     test_ds = tf.data.Dataset.from_tensor_slices((test_images.astype(np.float32), test_labels.astype(np.int64)))
     test_ds = test_ds.batch(32)
@@ -168,8 +209,8 @@ def write_input_files(images: np.ndarray, y: np.ndarray, format='png', path='fmn
     for i, img in enumerate(images):
         Image.fromarray(img).save(os.path.join(path, f'x_{i}.{format}'))
 
-def create_pretrained_tflite_model():
-    model = pretrain()
+def create_pretrained_tflite_model(fast=True):
+    model = pretrain_fast() if fast else pretrain()
     test(lambda x: model.predict(x))
     model_to_lite(model)
 
@@ -0,0 +1,203 @@
+import multiprocessing
+import socket
+import time
+
+import flwr as fl
+import numpy as np
+from flwr.common import (Code, EvaluateIns, EvaluateRes, FitIns, FitRes,
+                         GetParametersIns, GetParametersRes, Parameters,
+                         Status)
+from flwr.server import ServerConfig, start_server
+from flwr.server.strategy import FedAvgAndroid
+
+from federate_aggregator import run_aggregator
+from federate_server import fit_config
+
+# Checks that phones -> aggregators -> top-level server gives the same global weights as
+# phones -> top-level server (flat FedAvg), and that both match a NumPy reference. Also checks that
+# an aggregator whose only phone fails a round reports a failure and the training still finishes.
+
+FLAT_PORT = 18885
+TOP_PORT = 18886
+AGGREGATOR_PORTS = [18887, 18888]
+CLIENT_EXAMPLES = [3, 8, 1, 5, 13]
+# client i connects to aggregator CLIENT_AGGREGATOR[i] in the hierarchical setup
+CLIENT_AGGREGATOR = [0, 0, 1, 1, 1]
+ROUNDS = 3
+FAILURE_TOP_PORT = 18889
+FAILURE_AGGREGATOR_PORTS = [18890, 18891]
+# in the failure setup, client FAILING_CLIENT is alone behind aggregator 1 and fails fit and evaluate in FAILING_ROUND
+FAILURE_CLIENT_AGGREGATOR = [0, 0, 0, 0, 1]
+FAILING_CLIENT = 4
+FAILING_ROUND = 1
+SHAPES = [(6, 16), (16,), (16, 1), (1,)]
+
+
+def initial_weights():
+    rng = np.random.default_rng(0)
+    return [rng.normal(size=shape).astype(np.float32) for shape in SHAPES]
+
+def client_update(client_id: int, server_round: int):
+    rng = np.random.default_rng(1000 * client_id + server_round)
+    return [rng.normal(size=shape).astype(np.float32) for shape in SHAPES]
+
+def client_loss(client_id: int, server_round: int):
+    return float(client_id + 1) / server_round
+
+def to_parameters(weights) -> Parameters:
+    # same raw float32 encoding as the android client / FedAvgAndroid
+    return Parameters(tensors=[w.tobytes() for w in weights], tensor_type="numpy.nda")
+
+def from_parameters(parameters: Parameters):
+    return [np.frombuffer(t, dtype=np.float32).reshape(shape) for t, shape in zip(parameters.tensors, SHAPES)]
+
+
+class FakePhoneClient(fl.client.Client):
+    def __init__(self, client_id: int, failing_round: int = 0):
+        self.client_id = client_id
+        self.failing_round = failing_round
+        self.server_round = 0
+
+    def get_parameters(self, ins: GetParametersIns) -> GetParametersRes:
+        return GetParametersRes(status=Status(code=Code.OK, message=""), parameters=to_parameters(initial_weights()))
+
+    def fit(self, ins: FitIns) -> FitRes:
+        self.server_round += 1
+        if self.server_round == self.failing_round:
+            return FitRes(status=Status(code=Code.FIT_NOT_IMPLEMENTED, message="failing on purpose"),
+                          parameters=ins.parameters, num_examples=0, metrics={})
+        weights = from_parameters(ins.parameters)
+        updated = [w + d for w, d in zip(weights, client_update(self.client_id, self.server_round))]
+        return FitRes(status=Status(code=Code.OK, message=""), parameters=to_parameters(updated),
+                      num_examples=CLIENT_EXAMPLES[self.client_id], metrics={})
+
+    def evaluate(self, ins: EvaluateIns) -> EvaluateRes:
+        if self.server_round == self.failing_round:
+            return EvaluateRes(status=Status(code=Code.EVALUATE_NOT_IMPLEMENTED, message="failing on purpose"),
+                               loss=0., num_examples=0, metrics={})
+        return EvaluateRes(status=Status(code=Code.OK, message=""), loss=client_loss(self.client_id, self.server_round),
+                           num_examples=CLIENT_EXAMPLES[self.client_id], metrics={})
+
+
+class RecordingFedAvgAndroid(FedAvgAndroid):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_parameters = None
+
+    def aggregate_fit(self, server_round, results, failures):
+        parameters, metrics = super().aggregate_fit(server_round, results, failures)
+        self.last_parameters = parameters
+        return parameters, metrics
+
+
+def run_top_server(port: int, min_clients: int, result_queue):
+    strategy = RecordingFedAvgAndroid(
+        fraction_fit=1.0,
+        fraction_evaluate=1.0,
+        min_fit_clients=min_clients,
+        min_evaluate_clients=min_clients,
+        min_available_clients=min_clients,
+        evaluate_fn=None,
+        on_fit_config_fn=fit_config,
+    )
+    history = start_server(
+        server_address=f"127.0.0.1:{port}",
+        config=ServerConfig(num_rounds=ROUNDS),
+        strategy=strategy,
+    )
+    result_queue.put((
+        [w.tobytes() for w in from_parameters(strategy.last_parameters)],
+        history.losses_distributed,
+    ))
+
+def run_phone(client_id: int, port: int, failing_round: int = 0):
+    fl.client.start_client(server_address=f"127.0.0.1:{port}", client=FakePhoneClient(client_id, failing_round))
+
+def wait_for_port(port: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f'nothing listening on port {port} after {timeout}s')
+
+def run_processes(servers, clients, result_queue):
+    """Start `servers` ([(process, port)]) one by one, waiting until each listens, then `clients`."""
+    processes = [process for process, _ in servers] + clients
+    try:
+        for process, port in servers:
+            process.start()
+            wait_for_port(port)
+        for process in clients:
+            process.start()
+        result = result_queue.get(timeout=120)
+        for process in processes:
+            process.join(timeout=30)
+    finally:
+        # don't leave anything holding the ports if the run failed
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    weights = [np.frombuffer(t, dtype=np.float32).reshape(shape) for t, shape in zip(result[0], SHAPES)]
+    return weights, result[1]
+
+
+def run_flat(ctx):
+    result_queue = ctx.Queue()
+    servers = [(ctx.Process(target=run_top_server, args=(FLAT_PORT, len(CLIENT_EXAMPLES), result_queue)), FLAT_PORT)]
+    clients = [ctx.Process(target=run_phone, args=(i, FLAT_PORT)) for i in range(len(CLIENT_EXAMPLES))]
+    return run_processes(servers, clients, result_queue)
+
+def run_hierarchical(ctx, top_port=TOP_PORT, aggregator_ports=AGGREGATOR_PORTS, client_aggregator=CLIENT_AGGREGATOR,
+                     failing_client=None):
+    result_queue = ctx.Queue()
+    servers = [(ctx.Process(target=run_top_server, args=(top_port, len(aggregator_ports), result_queue)), top_port)]
+    for a, port in enumerate(aggregator_ports):
+        min_clients = client_aggregator.count(a)
+        servers.append((ctx.Process(target=run_aggregator, args=(port, f'127.0.0.1:{top_port}', min_clients, f'aggregator{a}')), port))
+    clients = [
+        ctx.Process(target=run_phone, args=(i, aggregator_ports[a], FAILING_ROUND if i == failing_client else 0))
+        for i, a in enumerate(client_aggregator)
+    ]
+    return run_processes(servers, clients, result_queue)
+
+def reference_fedavg(failing_client=None):
+    weights = [w.astype(np.float64) for w in initial_weights()]
+    losses = []
+    for server_round in range(1, ROUNDS + 1):
+        # failed clients are left out of both fit and evaluate aggregation in that round
+        clients = [i for i in range(len(CLIENT_EXAMPLES)) if not (i == failing_client and server_round == FAILING_ROUND)]
+        total = sum(CLIENT_EXAMPLES[i] for i in clients)
+        updates = {i: client_update(i, server_round) for i in clients}
+        weights = [
+            w + sum(CLIENT_EXAMPLES[i] * updates[i][layer] for i in clients) / total
+            for layer, w in enumerate(weights)
+        ]
+        losses.append((server_round, sum(CLIENT_EXAMPLES[i] * client_loss(i, server_round) for i in clients) / total))
+    return weights, losses
+
+def compare(name, weights, losses, expected_weights, expected_losses):
+    max_diff = max(np.max(np.abs(w - e)) for w, e in zip(weights, expected_weights))
+    loss_diff = max(abs(l[1] - e[1]) for l, e in zip(losses, expected_losses))
+    print(f'{name}: max weight diff={max_diff}\tmax loss diff={loss_diff}')
+    assert max_diff < 1e-5, name
+    assert loss_diff < 1e-6, name
+
+
+if __name__ == "__main__":
+    ctx = multiprocessing.get_context('spawn')
+    expected_weights, expected_losses = reference_fedavg()
+
+    flat_weights, flat_losses = run_flat(ctx)
+    hierarchical_weights, hierarchical_losses = run_hierarchical(ctx)
+    failure_weights, failure_losses = run_hierarchical(ctx, FAILURE_TOP_PORT, FAILURE_AGGREGATOR_PORTS,
+                                                       FAILURE_CLIENT_AGGREGATOR, FAILING_CLIENT)
+    failure_expected_weights, failure_expected_losses = reference_fedavg(FAILING_CLIENT)
+
+    compare('flat vs reference', flat_weights, flat_losses, expected_weights, expected_losses)
+    compare('hierarchical vs reference', hierarchical_weights, hierarchical_losses, expected_weights, expected_losses)
+    compare('hierarchical vs flat', hierarchical_weights, hierarchical_losses, flat_weights, flat_losses)
+    compare('hierarchical with failing client vs reference', failure_weights, failure_losses,
+            failure_expected_weights, failure_expected_losses)
@@ -1,3 +1,4 @@
+import time
 from typing import Any, Callable
 
 import numpy as np
@@ -21,26 +22,69 @@ def pretrain(model: TFLiteModelWrapper, x_train: np.ndarray, y_train: np.ndarray
         loss = epoch_loss / batches
         print(f'epoch {i + 1}: loss={loss}')
 
-def test_regression(predictor: Callable[[np.ndarray], dict[str, Any]], x_test: np.ndarray, y_test: np.ndarray, batch_size: int):
-    test_ds = tf.data.Dataset.from_tensor_slices((x_test.astype(np.float32), y_test.astype(np.float32)))
-    test_ds = test_ds.batch(batch_size)
-    preds = []
-    ys = []
-    for x, y in test_ds:
-        res = predictor(x)
-        y_pred = res['output']
-        preds.extend(y_pred.numpy().ravel())
-        ys.extend(y.numpy().ravel())
-
-    preds = np.array(preds)
-    ys = np.array(ys)
-
-    rmse = np.sqrt(np.sum((ys - preds)**2))
-    mae = np.sum(np.abs(ys - preds))
-    print(f'rmse={rmse}\tmae={mae}')
+def tflite_predictor(model_path: str) -> Callable[[np.ndarray], dict[str, Any]]:
+    interpreter = tf.lite.Interpreter(model_path=model_path)
+    interpreter.allocate_tensors()
+    predict = interpreter.get_signature_runner("predict")
+    return lambda x: predict(x=x)
+
+def predict_all(predictor: Callable[[np.ndarray], dict[str, Any]], x: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    preds = np.empty(x.shape[0], dtype=np.float32)
+    for i in range(0, x.shape[0], batch_size):
+        res = predictor(x[i:i + batch_size])
+        preds[i:i + batch_size] = np.asarray(res['output']).reshape(-1)
+    return preds
 
+def regression_report(y_true: np.ndarray, y_pred: np.ndarray, y_mean: float = 0., y_std: float = 1.,
+                      percentiles=(50, 90, 99)) -> dict[str, float]:
+    """Error metrics in de-normalized units (ms for time models), averaged over samples."""
+    y_true_ms = y_true.astype(np.float64).ravel() * y_std + y_mean
+    y_pred_ms = y_pred.astype(np.float64).ravel() * y_std + y_mean
+    abs_err = np.abs(y_pred_ms - y_true_ms)
+    nonzero = y_true_ms != 0
+
+    report = {
+        'rmse': float(np.sqrt(np.mean(abs_err ** 2))),
+        'mae': float(np.mean(abs_err)),
+        'mape': float(np.mean(abs_err[nonzero] / np.abs(y_true_ms[nonzero])) * 100) if nonzero.any() else float('nan'),
+    }
+    for p, value in zip(percentiles, np.percentile(abs_err, percentiles)):
+        report[f'p{p}'] = float(value)
+    return report
+
+def format_report(report: dict[str, float]) -> str:
+    return '\t'.join(f'{k}={v:.4f}' for k, v in report.items())
+
+def test_regression(predictor: Callable[[np.ndarray], dict[str, Any]], x_test: np.ndarray, y_test: np.ndarray,
+                    batch_size: int = 4096, y_mean: float = 0., y_std: float = 1.):
+    preds = predict_all(predictor, x_test, batch_size)
+    print(format_report(regression_report(y_test, preds, y_mean, y_std)))
     return preds
 
+def compare_predictors(predictors: dict[str, Callable[[np.ndarray], dict[str, Any]]], x_test: np.ndarray, y_test: np.ndarray,
+                       y_mean: float = 0., y_std: float = 1., batch_size: int = 4096) -> dict[str, dict[str, float]]:
+    """Evaluate predictors on the same data, first one is the reference others are checked against
+    (e.g. keras model vs its exported tflite version).
+    """
+    reports = {}
+    reference = None
+    for name, predictor in predictors.items():
+        predict_all(predictor, x_test[:batch_size], batch_size) # warmup (tracing, tensor allocation)
+        start = time.perf_counter()
+        preds = predict_all(predictor, x_test, batch_size)
+        elapsed = time.perf_counter() - start
+
+        report = regression_report(y_test, preds, y_mean, y_std)
+        report['time_ms'] = elapsed * 1000
+        if reference is None:
+            reference = preds
+        else:
+            report['max_diff_ms'] = float(np.max(np.abs(preds.astype(np.float64) - reference)) * y_std)
+        reports[name] = report
+        print(f'{name}:\t{format_report(report)}')
+    return reports
+
 X = np.array([
     [1326, 790, 218884],
     [1326, 690, 198884],
@@ -62,21 +106,26 @@ Y = (Y - np.mean(Y)) / np.std(Y)
 X_train, X_test = X[:6], X[6:]
 Y_train, Y_test = Y[:6], Y[6:]
 
-# local_time_model, tflite_path = create_local_time_model()
-
-# pretrain(local_time_model, X_train, Y_train, 20, 2)
-# test_regression(lambda x: local_time_model.predict(x), X_test, Y_test, 1)
-
-interpreter = tf.lite.Interpreter(model_path='./models/local_time.tflite')
-interpreter.allocate_tensors()
-
-# predict = interpreter.get_signature_runner("predict")
-# train_epoch = interpreter.get_signature_runner("train_epoch")
-# train_res = train_epoch(x_batch=X_train[:4], y_batch=Y_train[:4])
-# print(train_res)
-# predict_res = predict(x=X_test[:1]) 
-# print(predict_res)
-
-comp_loss = interpreter.get_signature_runner("compute_loss")
-v = comp_loss(y_true=Y_test, y_pred=Y_test + 4.0)
-print(v)
\ No newline at end of file
+if __name__ == "__main__":
+    # local_time_model, tflite_path = create_local_time_model()
+
+    # pretrain(local_time_model, X_train, Y_train, 20, 2)
+    # test_regression(lambda x: local_time_model.predict(x), X_test, Y_test, y_mean=y_mean, y_std=y_std)
+    # compare_predictors({
+    #     'keras': lambda x: local_time_model.predict(x),
+    #     'tflite': tflite_predictor(tflite_path),
+    # }, X_test, Y_test, y_mean, y_std)
+
+    interpreter = tf.lite.Interpreter(model_path='./models/local_time.tflite')
+    interpreter.allocate_tensors()
+
+    # predict = interpreter.get_signature_runner("predict")
+    # train_epoch = interpreter.get_signature_runner("train_epoch")
+    # train_res = train_epoch(x_batch=X_train[:4], y_batch=Y_train[:4])
+    # print(train_res)
+    # predict_res = predict(x=X_test[:1]) 
+    # print(predict_res)
+
+    comp_loss = interpreter.get_signature_runner("compute_loss")
+    v = comp_loss(y_true=Y_test, y_pred=Y_test + 4.0)
+    print(v)
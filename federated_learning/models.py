@@ -1,3 +1,7 @@
+import os
+import tempfile
+
+import numpy as np
 import tensorflow as tf
 
 from tflite_model_utils import (init_tflite_requirements,
@@ -6,66 +10,108 @@ from tflite_model_wrapper import TFLiteModelWrapper
 
 MODELS_DIR = './models'
 
-def create_local_time_model(output_dir=MODELS_DIR) -> tuple[TFLiteModelWrapper, str]:
+# Model and layer names are fixed to the ones the models bundled in app assets were created with
+# (all three built in one process by `__main__`), checkpoints address variables by name in `restore`.
+
+def build_local_time_model() -> TFLiteModelWrapper:
     input_dimensions = 6
-    output_path = f'{output_dir}/local_time.tflite'
 
     model = tf.keras.Sequential([
-        tf.keras.layers.Dense(16, activation='relu', kernel_regularizer=tf.keras.regularizers.l2()),
-        tf.keras.layers.Dense(8, activation='relu', kernel_regularizer=tf.keras.regularizers.l2()),
-        tf.keras.layers.Dense(4, activation='relu'),
-        tf.keras.layers.Dense(1)
-    ])
+        tf.keras.layers.Dense(16, activation='relu', kernel_regularizer=tf.keras.regularizers.l2(), name='dense'),
+        tf.keras.layers.Dense(8, activation='relu', kernel_regularizer=tf.keras.regularizers.l2(), name='dense_1'),
+        tf.keras.layers.Dense(4, activation='relu', name='dense_2'),
+        tf.keras.layers.Dense(1, name='dense_3')
+    ], name='sequential')
     optimizer = tf.keras.optimizers.Adam(learning_rate=0.001)
     loss = tf.keras.losses.MeanSquaredError()
 
     tflite_wrapper = TFLiteModelWrapper(model, optimizer, loss)
     init_tflite_requirements(tflite_wrapper, input_dimensions)
+    return tflite_wrapper
+
+def create_local_time_model(output_dir=MODELS_DIR) -> tuple[TFLiteModelWrapper, str]:
+    output_path = f'{output_dir}/local_time.tflite'
+
+    tflite_wrapper = build_local_time_model()
     save_tflite_model(tflite_wrapper, f'{output_dir}/local_time_model', output_path)
     print('local time model params:')
     print_model_tensor_sizes(tflite_wrapper)
     return tflite_wrapper, output_path
 
-def create_cloud_computation_time_model(output_dir=MODELS_DIR) -> tuple[TFLiteModelWrapper, str]:
+def build_cloud_computation_time_model() -> TFLiteModelWrapper:
     input_dimensions = 8
-    output_path = f'{output_dir}/cloud_computation_time.tflite'
 
     model = tf.keras.Sequential([
-        tf.keras.layers.Dense(16, activation='relu'),
-        tf.keras.layers.Dense(8, activation='relu'),
-        tf.keras.layers.Dense(4, activation='relu'),
-        tf.keras.layers.Dense(1)
-    ])
+        tf.keras.layers.Dense(16, activation='relu', name='dense_4'),
+        tf.keras.layers.Dense(8, activation='relu', name='dense_5'),
+        tf.keras.layers.Dense(4, activation='relu', name='dense_6'),
+        tf.keras.layers.Dense(1, name='dense_7')
+    ], name='sequential_1')
     optimizer = tf.keras.optimizers.Adam(learning_rate=0.001)
     loss = tf.keras.losses.MeanSquaredError()
 
     tflite_wrapper = TFLiteModelWrapper(model, optimizer, loss)
     init_tflite_requirements(tflite_wrapper, input_dimensions)
+    return tflite_wrapper
+
+def create_cloud_computation_time_model(output_dir=MODELS_DIR) -> tuple[TFLiteModelWrapper, str]:
+    output_path = f'{output_dir}/cloud_computation_time.tflite'
+
+    tflite_wrapper = build_cloud_computation_time_model()
     
     save_tflite_model(tflite_wrapper, f'{output_dir}/cloud_computation_time_model', output_path)
     print('cloud computation time model params:')
     print_model_tensor_sizes(tflite_wrapper)
     return tflite_wrapper, output_path
 
-def create_cloud_transmission_time_model(output_dir=MODELS_DIR) -> tuple[TFLiteModelWrapper, str]:
+def build_cloud_transmission_time_model() -> TFLiteModelWrapper:
     input_dimensions = 5
-    output_path = f'{output_dir}/cloud_transmission_time.tflite'
 
     model = tf.keras.Sequential([
-        tf.keras.layers.Dense(16, activation='relu'),
-        tf.keras.layers.Dense(8, activation='relu'),
-        tf.keras.layers.Dense(1)
-    ])
+        tf.keras.layers.Dense(16, activation='relu', name='dense_8'),
+        tf.keras.layers.Dense(8, activation='relu', name='dense_9'),
+        tf.keras.layers.Dense(1, name='dense_10')
+    ], name='sequential_2')
     optimizer = tf.keras.optimizers.Adam(learning_rate=0.001)
     loss = tf.keras.losses.MeanSquaredError()
 
     tflite_wrapper = TFLiteModelWrapper(model, optimizer, loss)
     init_tflite_requirements(tflite_wrapper, input_dimensions)
+    return tflite_wrapper
+
+def create_cloud_transmission_time_model(output_dir=MODELS_DIR) -> tuple[TFLiteModelWrapper, str]:
+    output_path = f'{output_dir}/cloud_transmission_time.tflite'
+
+    tflite_wrapper = build_cloud_transmission_time_model()
     save_tflite_model(tflite_wrapper, f'{output_dir}/cloud_transmission_time_model', output_path)
     print('cloud transmission time model params:')
     print_model_tensor_sizes(tflite_wrapper)
     return tflite_wrapper, output_path
 
+MODEL_BUILDERS = {
+    "local_time": build_local_time_model,
+    "cloud_computation_time": build_cloud_computation_time_model,
+    "cloud_transmission_time": build_cloud_transmission_time_model,
+}
+
+def export_trained_model(name: str, weights: list[np.ndarray]) -> dict[str, bytes]:
+    """Build model `name` with given weights (flat FedAvgAndroid arrays are reshaped),
+    return content of its `.tflite` file and of a checkpoint loadable with the `restore` signature.
+    """
+    tflite_wrapper = MODEL_BUILDERS[name]()
+    tflite_wrapper.set_weights_from_fl(**{
+        f'a{index}': tf.reshape(weight, variable.shape)
+        for index, (weight, variable) in enumerate(zip(weights, tflite_wrapper.model.weights))
+    })
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tflite_path = os.path.join(tmp_dir, f'{name}.tflite')
+        checkpoint_path = os.path.join(tmp_dir, f'{name}.ckpt')
+        save_tflite_model(tflite_wrapper, os.path.join(tmp_dir, f'{name}_model'), tflite_path)
+        tflite_wrapper.save(tf.constant(checkpoint_path))
+        with open(tflite_path, 'rb') as tflite_file, open(checkpoint_path, 'rb') as checkpoint_file:
+            return {"tflite": tflite_file.read(), "ckpt": checkpoint_file.read()}
+
 if __name__ == "__main__":
     create_local_time_model()
     create_cloud_computation_time_model()